@@ -489,10 +489,13 @@ class MultiSubExperimentCrossStepMetricAggregator(CrossStepMetricAggregator):
     """Merges metrics from sub-experiments."""
     merged_metrics_across_steps = collections.defaultdict(dict)
     for step, metrics in metrics_across_steps:
-      step = step % SUB_EXPERIMENT_STEP_OFFSET
-      merged_metrics_across_steps[step].update(metrics)
+      merged_metrics_across_steps[self._merged_step(step)].update(metrics)
     return [(s, m) for s, m in merged_metrics_across_steps.items()]
 
+  def _merged_step(self, step: int) -> int:
+    """Returns the step that metrics reported at `step` are merged into."""
+    return step % SUB_EXPERIMENT_STEP_OFFSET
+
   @abc.abstractmethod
   def call(
       self, merged_metrics_across_steps: Sequence[Tuple[int, Dict[str, float]]]
@@ -501,7 +504,12 @@ class MultiSubExperimentCrossStepMetricAggregator(CrossStepMetricAggregator):
 
 
 class LastReportedMetricValues(MultiSubExperimentCrossStepMetricAggregator):
-  """Returns the last reported metrics."""
+  """Returns the last reported metrics.
+
+  `aggregate_measurements` only reads the measurements of the last merged step.
+  Subclasses that change how metrics are merged or selected shall override it
+  to call the aggregator instead.
+  """
 
   def call(
       self, merged_metrics_across_steps: Sequence[Tuple[int, Dict[str, float]]]
@@ -509,6 +517,25 @@ class LastReportedMetricValues(MultiSubExperimentCrossStepMetricAggregator):
     """Returns an aggregated metric dict from metrics from multiple steps."""
     return merged_metrics_across_steps[-1][1]
 
+  def aggregate_measurements(
+      self, measurements: Sequence[pg.tuning.Measurement]
+      ) -> Dict[str, float]:
+    """See base class."""
+    if not measurements:
+      return super().aggregate_measurements(measurements)
+
+    # Merged steps are ordered by their first report.
+    merged_steps = dict.fromkeys(
+        self._merged_step(m.step) for m in measurements)
+    last_step = next(reversed(merged_steps))
+
+    metrics = {}
+    for m in measurements:
+      if self._merged_step(m.step) == last_step:
+        metrics.update(m.metrics)
+        metrics['reward'] = m.reward
+    return metrics
+
 
 class AverageMetricValues(MultiSubExperimentCrossStepMetricAggregator):
   """Returns the average values of per-step metrics."""
@@ -90,6 +90,22 @@ class CrossStepMetricAggregator(BaseParameterizable, metaclass=abc.ABCMeta):
       An aggregated metric dict used for final reward computing.
     """
 
+  def aggregate_measurements(
+      self, measurements: Sequence[pg.tuning.Measurement]
+      ) -> Dict[str, float]:
+    """Aggregates the metrics of trial measurements across steps.
+
+    Args:
+      measurements: A sequence of trial measurements.
+
+    Returns:
+      An aggregated metric dict which includes the reward as 'reward'.
+    """
+    # Each step gets its own copy of the metrics with the reward added, so
+    # aggregators are free to modify them.
+    return self([(m.step, {**m.metrics, 'reward': m.reward})
+                 for m in measurements])
+
 
 # To avoid introducing dependency on base_experiment,
 # we use Any as its PyType annotation for now.
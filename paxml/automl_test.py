@@ -555,6 +555,31 @@ class CrossStepMetricAggregatorTest(absltest.TestCase):
             'reward:2x': 0.4, 'eval_test_abc/metrics/total_loss:2x': 0.4
         })
 
+  def test_last_reported_metric_values_from_measurements(self):
+    aggregator = instantiate(automl.LastReportedMetricValues.HParams())
+    measurements = [
+        pg.tuning.Measurement(step=100, reward=0.1, metrics={'x': 1.0}),
+        pg.tuning.Measurement(step=200, reward=0.2, metrics={'x': 2.0}),
+        pg.tuning.Measurement(
+            step=automl.SUB_EXPERIMENT_STEP_OFFSET + 100, reward=0.3,
+            metrics={'y': 3.0}),
+        pg.tuning.Measurement(
+            step=automl.SUB_EXPERIMENT_STEP_OFFSET + 200, reward=0.4,
+            metrics={'y': 4.0}),
+    ]
+    self.assertEqual(
+        aggregator.aggregate_measurements(measurements),
+        {'x': 2.0, 'y': 4.0, 'reward': 0.4})
+    self.assertEqual(
+        aggregator.aggregate_measurements(measurements),
+        aggregator([(m.step, {**m.metrics, 'reward': m.reward})
+                    for m in measurements]))
+    # The last merged step is the one first reported last, which may not be
+    # the step of the last measurement.
+    self.assertEqual(
+        aggregator.aggregate_measurements(measurements[:3]),
+        {'x': 2.0, 'reward': 0.2})
+
   def test_average_metric_values(self):
     aggregator = instantiate(automl.AverageMetricValues.HParams())
     self.assertEqual(
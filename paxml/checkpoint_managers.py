@@ -15,12 +15,14 @@
 
 """Module to manage checkpoint metadata and automatic checkpoint deletion."""
 
+import concurrent.futures
 import dataclasses
 import datetime
 import os
 import typing
-from typing import Any, Optional, List, Union, Mapping
+from typing import Any, Callable, Dict, Optional, List, Sequence, Set, Union, Mapping
 
+from absl import logging
 from etils import epath
 import jax
 import orbax.checkpoint
@@ -37,6 +39,37 @@ CheckpointType = checkpoint_pb2.CheckpointType
 CHECKPOINT_PREFIX = 'checkpoint_'
 DEFAULT_ITEM_NAME = orbax.checkpoint.checkpoint_manager.DEFAULT_ITEM_NAME
 METRIC_ITEM_NAME = orbax.checkpoint.checkpoint_manager.METRIC_ITEM_NAME
+# File under the checkpoint root rewritten after each tmp directory cleanup.
+_TMP_CLEAN_SENTINEL_FILE = '.tmp_clean'
+# Max number of threads used to overlap independent file system calls.
+_MAX_CONCURRENT_IO = 32
+
+
+def _is_checkpoint_dirname(name: str) -> bool:
+  """Same as `checkpoints.is_checkpoint_asset`, for a name without parents."""
+  # The cheap prefix check rejects unrelated entries before the regex match.
+  return (name.startswith(CHECKPOINT_PREFIX) and
+          checkpoints.CHECKPOINT_PATTERN_RE.match(name) is not None)
+
+
+def _is_local_path(path: epath.PathLike) -> bool:
+  """Returns True if `path` is on the local file system (has no scheme)."""
+  return '://' not in os.fspath(path)
+
+
+def _gfile_mtime(path: epath.PathLike) -> float:
+  """Returns the mtime of `path` in seconds, with a single gfile stat call."""
+  return tf.io.gfile.stat(os.fspath(path)).mtime_nsec / 1e9
+
+
+def _concurrent_map(fn: Callable[[Any], Any],
+                    items: Sequence[Any]) -> List[Any]:
+  """Applies `fn` to each of `items` on a thread pool, preserving order."""
+  if len(items) <= 1:
+    return [fn(x) for x in items]
+  with concurrent.futures.ThreadPoolExecutor(
+      max_workers=min(_MAX_CONCURRENT_IO, len(items))) as executor:
+    return list(executor.map(fn, items))
 
 
 @dataclasses.dataclass
@@ -50,8 +83,29 @@ class CheckpointManagerOptions(orbax.checkpoint.CheckpointManagerOptions):
       a subdirectory with the provided string. Otherwise, they will be directly
       deleted from the file system. Useful if checkpoint deletion is time
       consuming. By default, delete the checkpoint assets.
+    probe_based_discovery: If True, `all_steps(read=True)` discovers new
+      checkpoints by checking for the expected directory names of the steps on
+      the `save_interval_steps` grid following the last known checkpoint, and
+      re-checks that the known checkpoints still exist, instead of listing the
+      whole checkpoint directory. This is much cheaper on directories with
+      many entries, but checkpoints saved off the save interval after the last
+      known one (e.g. on preemption) are not discovered. By default, list the
+      directory.
+    enable_background_delete: If True, old checkpoints are deleted (or renamed
+      into `todelete_subdir`) by a background thread, so that deletion does not
+      block training. Pending deletions are waited for by the next
+      `wait_until_finished` call (hence before the next save) and by `close`.
+    skip_unchanged_tmp_cleanup: If True, the scan for tmp directories left by
+      unfinalized saves is skipped when the checkpoint root has not been
+      modified since the last cleanup, based on directory mtimes. Only
+      applies to local file systems, and must only be enabled when creating a
+      directory entry updates the mtime of its parent (i.e. not on FUSE
+      mounts of object stores). By default, always scan.
   """
   todelete_subdir: Optional[str] = None
+  probe_based_discovery: bool = False
+  enable_background_delete: bool = False
+  skip_unchanged_tmp_cleanup: bool = False
 
 
 class OrbaxCheckpointManager(orbax.checkpoint.CheckpointManager):
@@ -76,32 +130,116 @@ class OrbaxCheckpointManager(orbax.checkpoint.CheckpointManager):
     if checkpoint_type == CheckpointType.CHECKPOINT_UNSPECIFIED:
       raise ValueError('Must specify checkpoint type.')
     self._checkpoint_type = checkpoint_type
+    # Resolved once as it is called for every checkpoint step handled.
+    self._checkpoint_name: Callable[[Union[int, str]], str]
+    if checkpoint_type == CheckpointType.CHECKPOINT_FLAX:
+      self._checkpoint_name = lambda step: f'{CHECKPOINT_PREFIX}{step}'
+    else:
+      self._checkpoint_name = checkpoints.checkpoint_name
+    # Tags of the `sync_global_devices` barriers deferred to the next save or
+    # restore. Set before the superclass constructor, which runs the cleanup.
+    self._pending_sync_tags: Set[str] = set()
     super().__init__(*args, **kwargs)
     # Set to 1 if not provided or set to 0.
     self._options.save_interval_steps = self._options.save_interval_steps or 1
+    # Read on every step by `should_save`.
+    self._save_interval = self._options.save_interval_steps
+    # `self._options` typed as the Pax-specific options.
+    self._pax_options = typing.cast(CheckpointManagerOptions, self._options)
+    # The `todelete_subdir` directories known to exist.
+    self._created_todelete_subdirs: Set[str] = set()
+    self._delete_executor = None
+    self._pending_deletes: List[concurrent.futures.Future] = []
+    if (self._pax_options.enable_background_delete and
+        jax.process_index() == 0):
+      self._delete_executor = concurrent.futures.ThreadPoolExecutor(
+          max_workers=2, thread_name_prefix='checkpoint_delete')
+
+  def flush_pending_sync(self):
+    """Issues a single barrier for all the deferred barriers, if any.
+
+    Barriers which only make the effects of process 0 visible to the other
+    processes (e.g. the cleanup of tmp directories) are deferred and coalesced.
+    They are flushed before any save or restore, so this only needs to be
+    called explicitly by users reading the checkpoint directory directly. Like
+    `sync_global_devices`, it must be called by all processes.
+    """
+    if not self._pending_sync_tags:
+      return
+    tags = ','.join(sorted(self._pending_sync_tags))
+    self._pending_sync_tags.clear()
+    py_utils.sync_global_devices(tags)
+
+  def save(self, step: int, *args, **kwargs) -> bool:
+    """See superclass."""
+    self.flush_pending_sync()
+    return super().save(step, *args, **kwargs)
+
+  def restore(self, step: int, *args,
+              **kwargs) -> Union[Any, Mapping[str, Any]]:
+    """See superclass."""
+    self.flush_pending_sync()
+    return super().restore(step, *args, **kwargs)
+
+  def all_steps(self, read: bool = False) -> Sequence[int]:
+    """See superclass.
+
+    When `probe_based_discovery` is set and some checkpoints are already known,
+    reading from storage only checks the known checkpoints, dropping those
+    deleted since (e.g. by a writer with `max_to_keep`), and probes for the
+    checkpoints following the last known one.
+    """
+    if (read and self._pax_options.probe_based_discovery and
+        self._checkpoints):
+      known_steps = [ckpt.step for ckpt in self._checkpoints]
+      exists = _concurrent_map(
+          lambda step: tf.io.gfile.exists(
+              self.directory / self._checkpoint_name(step)), known_steps)
+      return [s for s, e in zip(known_steps, exists) if e] + (
+          self._probe_steps_forward(known_steps[-1], self._save_interval))
+    return super().all_steps(read=read)
+
+  def _probe_steps_forward(self, last_step: int, stride: int) -> List[int]:
+    """Returns the finalized checkpoint steps found after `last_step`.
+
+    The multiples of `stride` following `last_step` are checked by their
+    expected checkpoint directory name until the first missing one. The first
+    probed step is aligned on `stride` even if `last_step` is not (e.g. for a
+    checkpoint saved on preemption), since the writer saves on multiples of
+    the save interval.
+
+    Args:
+      last_step: The last known checkpoint step.
+      stride: The interval between two consecutive checkpoint steps.
 
-  def _checkpoint_name(self, step: Union[int, str]) -> str:
-    if self._checkpoint_type == CheckpointType.CHECKPOINT_FLAX:
-      return f'{CHECKPOINT_PREFIX}{step}'
-    else:
-      return checkpoints.checkpoint_name(step)
+    Returns:
+      The list of found steps, in increasing order.
+    """
+    steps = []
+    step = (last_step // stride + 1) * stride
+    while True:
+      path = self.directory / self._checkpoint_name(step)
+      if not (tf.io.gfile.exists(path) and
+              orbax.checkpoint.utils.is_checkpoint_item_finalized(path)):
+        return steps
+      steps.append(step)
+      step += stride
 
   def should_save(self, step: int) -> bool:
     """Indicates whether there is a need to save a checkpoint."""
+    last_checkpoint = self._last_checkpoint
+    if step % self._save_interval:
+      # Off the save interval, only save an on-demand checkpoint due to
+      # preemption, or the very first checkpoint.
+      return (preemption.reached_preemption_sync_point(step) or
+              last_checkpoint is None)
     # Whether to save an on-demand checkpoint due to preemption
     if preemption.reached_preemption_sync_point(step):
       return True
-    last_checkpoint_step = (
-        self._last_checkpoint.step if self._last_checkpoint else None)
-    # Ensure current step is between the last step and next step (accounting for
-    # save interval). The `last_checkpoint_step` may not be initialized, in
-    # which case we should save. Otherwise, step must fall on the specified
-    # save interval. This condition accounts for the possibility of saving
-    # on preemption, in which case we want to maintain the same save period as
-    # if preemption had not happened.
-    return last_checkpoint_step is None or (
-        last_checkpoint_step < step and
-        step % self._options.save_interval_steps == 0)
+    # Ensure current step is after the last step. The `last_checkpoint` may not
+    # be initialized, in which case we should save. Saving on preemption does
+    # not shift the save period, since step must fall on the save interval.
+    return last_checkpoint is None or last_checkpoint.step < step
 
   # TODO(b/262389151) Rely on superclass logic when possible.
   def _create_checkpoints(
@@ -117,32 +255,32 @@ class OrbaxCheckpointManager(orbax.checkpoint.CheckpointManager):
     Returns:
       a list of CheckpointInfo, sorted by increasing step.
     """
-    checkpoint_dirnames = tf.io.gfile.listdir(self.directory)
-    dirnames = [
-        x for x in checkpoint_dirnames if checkpoints.is_checkpoint_asset(x)
-    ]
-    steps = sorted([
-        int(os.path.basename(x).replace(checkpoints.CHECKPOINT_PREFIX, ''))
-        for x in dirnames
-    ])
-    if not steps:
+    if orbax.checkpoint.utils.is_gcs_path(self.directory):
+      # On GCS, unfinalized checkpoints are not renamed and would be listed
+      # until process 0 has removed them.
+      self.flush_pending_sync()
+    step_mtimes = self._read_checkpoint_mtimes()
+    if not step_mtimes:
       return []
+    steps = list(step_mtimes)
 
     tz = datetime.timezone.utc
     times = [
-        datetime.datetime.fromtimestamp(
-            (self.directory / self._checkpoint_name(step)).stat().mtime, tz=tz)
+        datetime.datetime.fromtimestamp(step_mtimes[step], tz=tz)
         for step in steps
     ]
 
-    def get_metrics(step):
-      if self._track_best:
+    if self._track_best:
+
+      def get_metrics(step):
         restored = self._restore_impl(step, {METRIC_ITEM_NAME: None}, {})
         if METRIC_ITEM_NAME in restored:
           return restored[METRIC_ITEM_NAME]
-      return None
+        return None
 
-    metrics = [get_metrics(step) for step in steps]
+      metrics = _concurrent_map(get_metrics, steps)
+    else:
+      metrics = [None] * len(steps)
 
     return [
         orbax.checkpoint.checkpoint_manager.CheckpointInfo(
@@ -150,6 +288,38 @@ class OrbaxCheckpointManager(orbax.checkpoint.CheckpointManager):
         for s, t, m in zip(steps, times, metrics)
     ]
 
+  def _read_checkpoint_mtimes(self) -> Dict[int, float]:
+    """Returns a mapping from checkpoint step to its directory mtime.
+
+    The mapping is ordered by increasing step.
+
+    The checkpoint root is listed once, and each checkpoint asset is stat-ed
+    through the name returned by the listing rather than a name re-derived from
+    the step, so that no extra lookup is issued per step. The stats are issued
+    concurrently since each may be a network round trip. Local directories are
+    read with `os.scandir` instead.
+    """
+    # Entries returned by `listdir` are already basenames, and checkpoint assets
+    # start with the prefix, so the step is only the rest of the name.
+    prefix_len = len(checkpoints.CHECKPOINT_PREFIX)
+    directory = os.fspath(self.directory)
+    if _is_local_path(directory):
+      # Local file system: skip the gfile layer, and get each mtime along with
+      # the directory listing.
+      with os.scandir(directory) as entries:
+        return dict(
+            sorted((int(e.name[prefix_len:]), e.stat().st_mtime_ns / 1e9)
+                   for e in entries
+                   if _is_checkpoint_dirname(e.name)))
+    step_names = dict(
+        sorted((int(name[prefix_len:]), name)
+               for name in tf.io.gfile.listdir(self.directory)
+               if _is_checkpoint_dirname(name)))
+    mtimes = _concurrent_map(
+        lambda name: _gfile_mtime(self.directory / name),
+        list(step_names.values()))
+    return dict(zip(step_names, mtimes))
+
   def _get_save_directory(self,
                           step: int,
                           directory: epath.Path,
@@ -167,28 +337,109 @@ class OrbaxCheckpointManager(orbax.checkpoint.CheckpointManager):
     if py_utils.is_mock_tpu_backend():
       return
 
-    tmp_dirs = [
-        f
-        for f in self.directory.glob(CHECKPOINT_PREFIX + '*')
-        if not orbax.checkpoint.utils.is_checkpoint_item_finalized(f)
-    ]
-    if jax.process_index() == 0:
-      for tmp_dir in tmp_dirs:
+    # Only process 0 removes tmp directories, so it is the only one scanning
+    # for them.
+    if (jax.process_index() == 0 and
+        not self._is_known_clean_of_tmp_directories()):
+      tmp_dirs = [
+          f
+          for f in self.directory.glob(CHECKPOINT_PREFIX + '*')
+          if not orbax.checkpoint.utils.is_checkpoint_item_finalized(f)
+      ]
+
+      def remove_tmp_dir(tmp_dir: epath.Path):
         assert tmp_dir.is_dir()
         tmp_dir.rmtree()
-    py_utils.sync_global_devices('cleanup_tmp_dirs')
+
+      # Removing a directory tree issues many independent deletions on object
+      # stores, so tmp directories are removed concurrently.
+      _concurrent_map(remove_tmp_dir, tmp_dirs)
+      if self._may_skip_tmp_cleanup():
+        (self.directory / _TMP_CLEAN_SENTINEL_FILE).write_text('')
+    # Other processes never touch tmp directories, so they do not need to wait
+    # for their removal right away (see `flush_pending_sync`).
+    self._pending_sync_tags.add('cleanup_tmp_dirs')
+
+  def _may_skip_tmp_cleanup(self) -> bool:
+    """Returns True if tmp cleanups may be skipped (and tracked by a sentinel).
+
+    Called from the superclass constructor, before `self._pax_options` is set.
+    """
+    return (getattr(self._options, 'skip_unchanged_tmp_cleanup', False) and
+            _is_local_path(self.directory))
+
+  def _is_known_clean_of_tmp_directories(self) -> bool:
+    """Returns True if no tmp directory can have appeared since last cleanup.
+
+    A sentinel file is rewritten after each cleanup. Creating or renaming a
+    checkpoint directory updates the mtime of the checkpoint root on local file
+    systems, so a sentinel strictly newer than the root guarantees that there
+    is nothing to clean up. Object stores (and FUSE mounts of them) do not keep
+    directory mtimes, hence this is only enabled by
+    `skip_unchanged_tmp_cleanup`, for local paths.
+    """
+    if not self._may_skip_tmp_cleanup():
+      return False
+    # Both mtimes are read with `os.stat`, like the checkpoint mtimes of local
+    # directories (see `_read_checkpoint_mtimes`), so that they have the same
+    # (sub-second) resolution and are directly comparable.
+    try:
+      sentinel_mtime = os.stat(
+          self.directory / _TMP_CLEAN_SENTINEL_FILE).st_mtime_ns
+    except FileNotFoundError:
+      return False
+    directory_mtime = os.stat(self.directory).st_mtime_ns
+    return sentinel_mtime > directory_mtime
+
+  def wait_until_finished(self):
+    """See superclass.
+
+    Additionally waits for the background deletions started by the previous
+    call, if `enable_background_delete` is set. Deletions started by this call
+    keep running in the background.
+    """
+    self._wait_for_pending_deletes()
+    super().wait_until_finished()
+
+  def close(self):
+    """Waits for all background deletions and releases the deletion thread."""
+    self._wait_for_pending_deletes()
+    if self._delete_executor is not None:
+      self._delete_executor.shutdown()
+      self._delete_executor = None
+
+  def _wait_for_pending_deletes(self):
+    pending_deletes, self._pending_deletes = self._pending_deletes, []
+    concurrent.futures.wait(pending_deletes)
 
   def _delete_directory(self, step: int):
     if jax.process_index() != 0:
       return
-    options = typing.cast(CheckpointManagerOptions, self._options)
-    todelete_subdir = options.todelete_subdir
+    if self._delete_executor is None:
+      self._delete_directory_now(step)
+    else:
+      self._pending_deletes.append(
+          self._delete_executor.submit(self._delete_directory_in_background,
+                                       step))
+
+  def _delete_directory_in_background(self, step: int):
+    try:
+      self._delete_directory_now(step)
+    except Exception:  # pylint: disable=broad-except
+      # Failing to delete an old checkpoint must not crash training.
+      logging.exception('Failed to delete checkpoint for step %d.', step)
+
+  def _delete_directory_now(self, step: int):
+    todelete_subdir = self._pax_options.todelete_subdir
     checkpoint_name = self._checkpoint_name(step)
 
     if todelete_subdir:
       rename_dir = self.directory / todelete_subdir
-      if not rename_dir.exists():
-        rename_dir.mkdir(parents=True)
+      if todelete_subdir not in self._created_todelete_subdirs:
+        # `exist_ok` since the directory may be left by a previous run, or be
+        # created concurrently by background deletions.
+        rename_dir.mkdir(parents=True, exist_ok=True)
+        self._created_todelete_subdirs.add(todelete_subdir)
       src = self.directory / checkpoint_name
       dst = rename_dir / checkpoint_name
       # TODO(pax-team): Check if dst already exists?
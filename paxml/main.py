@@ -21,6 +21,7 @@ python paxml/main.py \
     --job_log_dir=/tmp/jax_log_dir/exp01
 """
 
+import functools
 import importlib
 import os
 import random
@@ -56,6 +57,9 @@ AsyncPersistenceCheckpointer = checkpoints.AsyncCheckpointer  # mapped to intern
 
 FLAGS = flags.FLAGS
 
+# Pre-bound registry lookup used by `get_experiment`.
+_REGISTRY_GET = experiment_registry.get
+
 flags.DEFINE_string(
     'exp', None,
     'Experiment configuration identifier name. This name typically '
@@ -110,6 +114,11 @@ flags.DEFINE_string(
     'subdirectory with the provided string. Otherwise, they will be directly '
     'deleted from the file system. Useful if checkpoint deletion is time '
     'consuming. By default, delete the checkpoint assets.')
+flags.DEFINE_bool(
+    'checkpoint_background_delete', False,
+    'If set, checkpoints are deleted (or renamed into '
+    '--checkpoint_todelete_subdir) by a background thread, so that deletion '
+    'does not block training.')
 epath.DEFINE_path(
     'restore_checkpoint_dir', None,
     'If set, the directory from which to restore checkpoint. Only supported '
@@ -167,13 +176,29 @@ flags.DEFINE_integer(
 # --jax_xla_backend, --jax_enable_checks are available through JAX.
 
 
+@functools.lru_cache(maxsize=1024)
 def get_experiment(experiment_name: str) -> base_experiment.BaseExperimentT:
-  """Retrieves an experiment config from the global registry."""
-  experiment_class = experiment_registry.get(experiment_name)
+  """Retrieves an experiment config from the global registry.
+
+  Successful lookups are memoized by experiment name (failed ones raise and are
+  not cached). Use `get_experiment.cache_clear()` to drop the cached classes,
+  e.g. after re-registering an experiment.
+
+  Args:
+    experiment_name: The name of the experiment, as registered or as the full
+      path to the experiment class.
+
+  Returns:
+    The experiment class.
+  """
+  experiment_class = _REGISTRY_GET(experiment_name)
   if experiment_class is not None:
     return experiment_class
   # Try to import the module that registers the experiment, assuming the
-  # experiment name contains the full path.
+  # experiment name contains the full path. A name without a module part cannot
+  # be imported, and must not trigger the import of a top-level package.
+  if '.' not in experiment_name:
+    raise ValueError(f'Could not find experiment `{experiment_name}`.')
   module_name = experiment_name.rsplit('.', 1)[0]
   # Google-internal experiment module import code
   try:
@@ -181,7 +206,7 @@ def get_experiment(experiment_name: str) -> base_experiment.BaseExperimentT:
   except ModuleNotFoundError as e:
     raise ValueError(f'Could not find experiment `{experiment_name}`.') from e
   # Google-internal experiment module import cleanup
-  experiment_class = experiment_registry.get(experiment_name)
+  experiment_class = _REGISTRY_GET(experiment_name)
   if experiment_class is not None:
     return experiment_class
   raise ValueError(f'Could not find experiment `{experiment_name}`.')
@@ -241,7 +266,8 @@ def run_experiment(
         run_decode=FLAGS.decode_during_train,
         enable_auto_sharding=FLAGS.enable_auto_sharding,
         async_checkpointer=async_checkpointer,
-        enable_checkpoint_saving=enable_checkpoint_saving)
+        enable_checkpoint_saving=enable_checkpoint_saving,
+        checkpoint_background_delete=FLAGS.checkpoint_background_delete)
 
     if async_checkpointer is not None:
       async_checkpointer.wait_until_finished()
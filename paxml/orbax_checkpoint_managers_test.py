@@ -312,6 +312,81 @@ class CheckpointManagerTest(parameterized.TestCase):
     )
     self.assertSameElements([0], checkpoint_manager.all_steps())
 
+  def test_cleanup_with_sentinel(self):
+    def _fake_on_commit_callback(*args, **kwargs):
+      del args, kwargs
+      pass  # Do nothing to simulate failure of finalization.
+
+    options = checkpoint_managers.CheckpointManagerOptions(
+        save_interval_steps=1, skip_unchanged_tmp_cleanup=True
+    )
+    tmp_checkpoint_pattern = (
+        checkpoints.CHECKPOINT_PREFIX
+        + '*'
+        + orbax.checkpoint.utils.TMP_DIR_SUFFIX
+        + '*'
+    )
+
+    with mock.patch.object(
+        orbax.checkpoint.utils, 'ensure_atomic_save', autospec=True
+    ) as commit_callback:
+      commit_callback.side_effect = _fake_on_commit_callback
+      checkpoint_manager = self.create_checkpoint_manager(options)
+      # The sentinel is written by the cleanup run on construction.
+      self.assertTrue(
+          (checkpoint_manager.directory
+           / checkpoint_managers._TMP_CLEAN_SENTINEL_FILE).exists())  # pylint: disable=protected-access
+      checkpoint_manager.save(0, self.train_state)
+      # Step 0 not finalized.
+      self.assertNotEmpty(
+          list(checkpoint_manager.directory.glob(tmp_checkpoint_pattern))
+      )
+
+    # The tmp directory left behind is removed despite the sentinel.
+    checkpoint_manager = self.create_checkpoint_manager(options)
+    self.assertEmpty(
+        list(checkpoint_manager.directory.glob(tmp_checkpoint_pattern))
+    )
+
+  def test_cleanup_skipped_when_unchanged(self):
+    options = checkpoint_managers.CheckpointManagerOptions(
+        save_interval_steps=1, skip_unchanged_tmp_cleanup=True
+    )
+    checkpoint_manager = self.create_checkpoint_manager(options)
+    checkpoint_manager.save(0, self.train_state)
+    sentinel = os.path.join(
+        self.directory, checkpoint_managers._TMP_CLEAN_SENTINEL_FILE)  # pylint: disable=protected-access
+
+    def set_directory_mtime(delta_ns):
+      # Sets the mtime of the checkpoint root relative to the sentinel, since
+      # both may be updated within the same file system timestamp tick.
+      mtime_ns = os.stat(sentinel).st_mtime_ns + delta_ns
+      os.utime(self.directory, ns=(mtime_ns, mtime_ns))
+
+    def scans_for_tmp_directories():
+      with mock.patch.object(
+          orbax.checkpoint.utils,
+          'is_checkpoint_item_finalized',
+          wraps=orbax.checkpoint.utils.is_checkpoint_item_finalized,
+      ) as is_finalized:
+        self.create_checkpoint_manager(options)
+      return is_finalized.called
+
+    # The root is unchanged since the last cleanup.
+    set_directory_mtime(-1_000_000_000)
+    self.assertFalse(scans_for_tmp_directories())
+
+    # The root is modified after the last cleanup.
+    set_directory_mtime(1_000_000_000)
+    self.assertTrue(scans_for_tmp_directories())
+
+    # Directory mtimes are not trusted off the local file system.
+    set_directory_mtime(-1_000_000_000)
+    with mock.patch.object(
+        checkpoint_managers, '_is_local_path', autospec=True, return_value=False
+    ):
+      self.assertTrue(scans_for_tmp_directories())
+
   @parameterized.parameters((CheckpointType.CHECKPOINT_GDA,),
                             (CheckpointType.CHECKPOINT_FLAX,))
   def test_todelete_subdir(self, checkpoint_type):
@@ -332,5 +407,73 @@ class CheckpointManagerTest(parameterized.TestCase):
     self.assertIn('archive', tf.io.gfile.listdir(self.directory))
     self.assertSameElements([2, 3], checkpoint_manager.all_steps())
 
+  @parameterized.parameters((None,), ('archive',))
+  def test_background_delete(self, todelete_subdir):
+    options = checkpoint_managers.CheckpointManagerOptions(
+        max_to_keep=2,
+        todelete_subdir=todelete_subdir,
+        enable_background_delete=True)
+    checkpoint_manager = self.create_checkpoint_manager(options)
+
+    for step in range(4):
+      checkpoint_manager.save(step, self.train_state)
+    checkpoint_manager.close()
+
+    self.assertSameElements(
+        _expected_checkpoint_filenames([2, 3]),
+        _actual_checkpoint_filenames(self.directory))
+    if todelete_subdir:
+      self.assertSameElements(
+          _expected_checkpoint_filenames([0, 1]),
+          _actual_checkpoint_filenames(
+              os.path.join(self.directory, todelete_subdir)))
+    self.assertSameElements([2, 3], checkpoint_manager.all_steps())
+
+  def test_probe_based_discovery(self):
+    options = checkpoint_managers.CheckpointManagerOptions(
+        save_interval_steps=2, probe_based_discovery=True)
+    writer = self.create_checkpoint_manager(options)
+    for step in range(4):
+      writer.save(step, self.train_state)
+
+    reader = self.create_checkpoint_manager(options)
+    self.assertSameElements([0, 2], reader.all_steps(read=True))
+
+    for step in range(4, 8):
+      writer.save(step, self.train_state)
+    self.assertSameElements([0, 2, 4, 6], reader.all_steps(read=True))
+    # Cached steps are not refreshed without a read.
+    self.assertSameElements([0, 2], reader.all_steps())
+
+  def test_probe_based_discovery_after_unaligned_step(self):
+    options = checkpoint_managers.CheckpointManagerOptions(
+        save_interval_steps=4, probe_based_discovery=True)
+    writer = self.create_checkpoint_manager(options)
+    # The very first checkpoint is saved off the save interval.
+    writer.save(3, self.train_state)
+
+    reader = self.create_checkpoint_manager(options)
+    self.assertSameElements([3], reader.all_steps(read=True))
+
+    for step in range(4, 10):
+      writer.save(step, self.train_state)
+    self.assertSameElements([3, 4, 8], reader.all_steps(read=True))
+
+  def test_probe_based_discovery_with_max_to_keep(self):
+    options = checkpoint_managers.CheckpointManagerOptions(
+        save_interval_steps=2, max_to_keep=2, probe_based_discovery=True)
+    writer = self.create_checkpoint_manager(options)
+    for step in range(4):
+      writer.save(step, self.train_state)
+
+    reader = self.create_checkpoint_manager(options)
+    self.assertSameElements([0, 2], reader.all_steps(read=True))
+
+    for step in range(4, 8):
+      writer.save(step, self.train_state)
+    # Steps 0 and 2 have been deleted by the writer.
+    self.assertSameElements([4, 6], reader.all_steps(read=True))
+
+
 if __name__ == '__main__':
   absltest.main()
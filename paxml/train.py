@@ -161,6 +161,11 @@ class _TrainingCheckpointer(metaclass=abc.ABCMeta):
   def checkpoint_type(self) -> CheckpointType:
     raise NotImplementedError
 
+  @abc.abstractmethod
+  def close(self) -> None:
+    """Waits for pending checkpoint work and releases its resources."""
+    raise NotImplementedError
+
 
 class _OrbaxPjitTrainingCheckpointer(_TrainingCheckpointer):
 
@@ -255,6 +260,9 @@ class _OrbaxPjitTrainingCheckpointer(_TrainingCheckpointer):
   def checkpoint_type(self) -> CheckpointType:
     return self._checkpoint_type
 
+  def close(self) -> None:
+    self.checkpoint_manager.close()
+
 
 class _OrbaxPmapTrainingCheckpointer(_TrainingCheckpointer):
 
@@ -364,6 +372,9 @@ class _OrbaxPmapTrainingCheckpointer(_TrainingCheckpointer):
   def checkpoint_type(self) -> CheckpointType:
     return self._checkpoint_type
 
+  def close(self) -> None:
+    self.checkpoint_manager.close()
+
 
 def _create_checkpointer(
     task_p: tasks_lib.SingleTask.HParams,
@@ -372,6 +383,7 @@ def _create_checkpointer(
     todelete_subdir: Optional[str],
     async_checkpointer: Optional[checkpoints.AsyncCheckpointer] = None,
     enable_checkpoint_saving: bool = True,
+    enable_background_delete: bool = False,
 ) -> _TrainingCheckpointer:
   """Creates a checkpoint manager."""
   checkpoint_dir = _make_checkpoint_dir(job_log_dir)
@@ -384,7 +396,8 @@ def _create_checkpointer(
       max_to_keep=max_to_keep,
       save_interval_steps=save_interval_steps,
       keep_time_interval=keep_interval_timedelta,
-      todelete_subdir=todelete_subdir)
+      todelete_subdir=todelete_subdir,
+      enable_background_delete=enable_background_delete)
   checkpointer = async_checkpointer
   if checkpoint_type == CheckpointType.CHECKPOINT_FLAX:
     checkpointer = FlaxCheckpointer(FlaxCheckpointHandler())
@@ -487,7 +500,8 @@ def train_and_evaluate(
     run_decode: bool = False,
     enable_auto_sharding: bool = False,
     async_checkpointer: Optional[checkpoints.AsyncCheckpointer] = None,
-    enable_checkpoint_saving: bool = True) -> None:
+    enable_checkpoint_saving: bool = True,
+    checkpoint_background_delete: bool = False) -> None:
   """The shared path to run the training and evaluation loop.
 
   Args:
@@ -513,6 +527,9 @@ def train_and_evaluate(
       training to continue when checkpointing is going on as checkpointing
       happens in a different thread.
     enable_checkpoint_saving: Whether to perform checkpoint saving or not.
+    checkpoint_background_delete: If set, checkpoints are deleted (or renamed
+      into `checkpoint_todelete_subdir`) by a background thread, so that
+      deletion does not block training.
   """
   jax.monitoring.record_event('/jax/pax/train_and_evaluate/beacon')
   task_p = experiment_config.task()
@@ -561,19 +578,25 @@ def train_and_evaluate(
       checkpoint_type,
       checkpoint_todelete_subdir,
       async_checkpointer=async_checkpointer,
-      enable_checkpoint_saving=enable_checkpoint_saving)
+      enable_checkpoint_saving=enable_checkpoint_saving,
+      enable_background_delete=checkpoint_background_delete)
   if not enable_checkpoint_saving:
     logging.info(
         'Checkpointing is disabled and no checkpoint will be saved to disk.')
 
-  if task_p.model.ici_mesh_shape is not None:
-    train_and_evaluate_spmd_model(task_p, train_input_p, job_log_dir,
-                                  checkpointer, checkpoint_type, eval_input_p,
-                                  decode_input_p, early_stopping_fn,
-                                  enable_auto_sharding)
-  else:
-    train_and_evaluate_pmap(task_p, train_input_p, job_log_dir, checkpointer,
-                            eval_input_p, decode_input_p, early_stopping_fn)
+  try:
+    if task_p.model.ici_mesh_shape is not None:
+      train_and_evaluate_spmd_model(task_p, train_input_p, job_log_dir,
+                                    checkpointer, checkpoint_type, eval_input_p,
+                                    decode_input_p, early_stopping_fn,
+                                    enable_auto_sharding)
+    else:
+      train_and_evaluate_pmap(task_p, train_input_p, job_log_dir, checkpointer,
+                              eval_input_p, decode_input_p, early_stopping_fn)
+  finally:
+    # Managers are created per training run (e.g. per tuning trial), so their
+    # background resources are released when the run ends.
+    checkpointer.close()
 
 
 class _PeekableInput:
@@ -17,7 +17,9 @@
 
 import inspect
 import math
+import os
 import re
+import weakref
 
 from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union, Text, Type
 from absl import logging
@@ -55,10 +57,50 @@ TrialFn = Callable[[
 SUB_EXPERIMENT_STEP_INTERVAL = 1000_000_000
 
 
+# Bit values of running modes, which are checked on the hot path of every
+# training step without going through `enum.Flag` operations.
+_TRAIN_MODE = trainer_lib.RunningMode.TRAIN.value
+_EVAL_MODE = trainer_lib.RunningMode.EVAL.value
+_DECODE_MODE = trainer_lib.RunningMode.DECODE.value
+_EVAL_OR_DECODE_MODE = _EVAL_MODE | _DECODE_MODE
+
+
+# Characters that are dropped from parameter values when they are used as part
+# of trial directory names, after `_PATH_FRIENDLY_TRANSLATION` is applied.
+_NON_PATH_FRIENDLY_CHAR_SET = re.compile(r'[^\w\d=_-{}\(\).,\[\]]+')
+_PATH_FRIENDLY_TRANSLATION = str.maketrans({':': '=', '[': '{', ']': '}'})
+
+# Max number of formatted parameter values cached by a trial directory name
+# generator.
+_MAX_FORMATTED_VALUES = 4096
+# Max number of decision parts of trial directory names cached by a trial
+# directory name generator, keyed by trial DNA.
+_MAX_DIRNAME_SUFFIXES = 4096
+
+
+# Search spaces traced from experiment configs. Tracing evaluates the task and
+# datasets of an experiment, which is expensive and happens both when deciding
+# whether to tune and when starting the tuning loop. Entries are keyed by
+# experiment instances (rather than classes), as configs of the same class can
+# differ when built from flags.
+_SEARCH_SPACE_CACHE = weakref.WeakKeyDictionary()
+
+
 def get_search_space(
     experiment_config: base_experiment.BaseExperiment
     ) -> pg.hyper.DynamicEvaluationContext:
   """Gets the search space from experiment config."""
+  search_space = _SEARCH_SPACE_CACHE.get(experiment_config)
+  if search_space is None:
+    search_space = _trace_search_space(experiment_config)
+    _SEARCH_SPACE_CACHE[experiment_config] = search_space
+  return search_space
+
+
+def _trace_search_space(
+    experiment_config: base_experiment.BaseExperiment
+    ) -> pg.hyper.DynamicEvaluationContext:
+  """Traces the search space by evaluating the experiment config."""
   # Inspect the search space by evaluating the hyperparameters.
   # We include tuning parameters from both the `task` and `datasets` in the
   # search space. A caveat is that when multiple datasets have tunable
@@ -181,20 +223,27 @@ def tune(trial_fn: TrialFn,
     max_num_trials = min(max_num_trials, search_space.dna_spec.space_size)
 
   job_log_dir.mkdir(parents=True, exist_ok=True)
+  # Debug files have the same content across processes, so only the main host
+  # writes them and registers them as artifacts.
+  is_main_host = jax.process_index() == 0
   logging.info('Search space: %s', search_space.dna_spec)
-  search_space_debug_file = job_log_dir / 'search_space.txt'
-  _write_file_once(search_space_debug_file, str(search_space.dna_spec))
-  work_unit.create_artifact(
-      platform.ArtifactType.FILE, str(search_space_debug_file), 'search_space')
+  if is_main_host:
+    search_space_debug_file = job_log_dir / 'search_space.txt'
+    _write_file_once(search_space_debug_file, str(search_space.dna_spec))
+    work_unit.create_artifact(
+        platform.ArtifactType.FILE, str(search_space_debug_file),
+        'search_space')
 
   logging.info('Search algorithm: %s', search_algorithm)
-  algorithm_debug_file = job_log_dir / 'search_algorithm.txt'
-  _write_file_once(algorithm_debug_file, str(search_algorithm))
-  work_unit.create_artifact(
-      platform.ArtifactType.FILE, str(algorithm_debug_file), 'search_algorithm')
+  if is_main_host:
+    algorithm_debug_file = job_log_dir / 'search_algorithm.txt'
+    _write_file_once(algorithm_debug_file, str(search_algorithm))
+    work_unit.create_artifact(
+        platform.ArtifactType.FILE, str(algorithm_debug_file),
+        'search_algorithm')
 
   logging.info('Early stopping policy: %s', early_stopping_policy)
-  if early_stopping_policy is not None:
+  if early_stopping_policy is not None and is_main_host:
     early_stopping_policy_debug_file = (
         job_log_dir / 'early_stopping_policy_debug_file.txt')
     _write_file_once(early_stopping_policy_debug_file,
@@ -236,10 +285,11 @@ def tune(trial_fn: TrialFn,
     # Context manager to deliver different program hyperparameters
     # in each trial.
     with example():
-      trial_dirname = trial_dirname_generator.dirname(feedback.id)
+      trial_dirname = trial_dirname_generator.dirname(
+          feedback.id, feedback.dna)
       if (search_hparams.add_experiment_config_to_metadata
           and is_metric_reporting_role
-          and jax.process_index() == 0):
+          and is_main_host):
         _record_experiment_config(sub_experiments, feedback)
 
       for i, (sub_experiment_id, sub_experiment_cls) in enumerate(
@@ -360,6 +410,12 @@ class EarlyStoppingFn:
     self._is_metric_reporting_role = is_metric_reporting_role
     self._is_last_experiment = is_last_experiment
     self._tuning_step_start = tuning_step_start
+    self._is_main_host = jax.process_index() == 0
+    # Metric names suffixed with the sub-experiment ID, cached across steps as
+    # the same metrics are reported at every eval/decode step.
+    self._metric_key_suffix = (
+        f':{sub_experiment_id}' if sub_experiment_id else '')
+    self._suffixed_metric_keys: Dict[str, str] = {}
     if reward_fn is None:
       self._needs_train = False
       self._needs_eval = False
@@ -376,10 +432,12 @@ class EarlyStoppingFn:
                is_last_ckpt: bool) -> bool:
     """Returns True if trial should be stopped early."""
     tuning_step = self._tuning_step_start + global_step
+    # Whether all hosts have been synchronized after the metric update.
+    synced_after_update = False
     if self._is_metric_reporting_role:
       # For metric reporting role, when there is no eval and decode, early
       # stopping should always return False.
-      if running_mode.has_eval or running_mode.has_decode:
+      if running_mode.value & _EVAL_OR_DECODE_MODE:
 
         # NOTE(daiyip): the process of updating metrics may raises errors
         # (e.g. FloatPointError) which will be caught at higher level and
@@ -387,7 +445,7 @@ class EarlyStoppingFn:
         # trigger the `sync_global_devices` on all replicas uniformly here.
         try:
           # We only handle metric updates on main host.
-          if jax.process_index() == 0:
+          if self._is_main_host:
             self._update_metrics(
                 metrics, running_mode, tuning_step, is_last_ckpt)
         finally:
@@ -403,9 +461,10 @@ class EarlyStoppingFn:
           py_utils.sync_global_devices(
               f'Sync on trial {self._feedback.id} after {action_str} '
               f'at tuning step {tuning_step}.')
+          synced_after_update = True
       elif is_last_ckpt:
         if self._needs_eval or self._needs_decode:
-          if jax.process_index() == 0:
+          if self._is_main_host:
             trial = self._feedback.get_trial()
             if not trial.measurements:
               self._feedback.skip(
@@ -413,33 +472,49 @@ class EarlyStoppingFn:
                   f'(trial={self._feedback.id}, step={global_step})')
         else:
           try:
-            if jax.process_index() == 0:
+            if self._is_main_host:
               self._update_metrics(
                   metrics, running_mode, tuning_step, is_last_ckpt)
           finally:
             py_utils.sync_global_devices(
                 f'Sync on trial {self._feedback.id} with training metrics at '
                 f'the last step {tuning_step}.')
+            synced_after_update = True
       else:
         return False
 
     # Poll completion or early stopping decision, and sync on trial completion.
-    should_stop = False
+    should_stop, needs_sync = False, False
     if self._feedback.get_trial().status == 'COMPLETED':
       should_stop = True
+      # The trial is completed (e.g. via `feedback.done`) before the barrier
+      # after the metric update, which all hosts have passed already, so they
+      # can advance to the next trial without another barrier.
+      needs_sync = not synced_after_update
     elif self._feedback.should_stop_early():
       # `feedback.skip` is preferably called just once, so we always call
       # it on the main host.
-      if jax.process_index() == 0:
+      if self._is_main_host:
         self._feedback.skip()
-      should_stop = True
-    if should_stop:
+      should_stop, needs_sync = True, True
+    if needs_sync:
       # NOTE(daiyip): at the end of each trial, we sync all hosts to make sure
       # they advance to the next trial at the same time.
       py_utils.sync_global_devices(
           f'Sync on trial {self._feedback.id} upon completion.')
     return should_stop
 
+  def needs_metrics(self,
+                    running_mode: trainer_lib.RunningMode,
+                    is_last_ckpt: bool) -> bool:
+    """Returns True if metrics passed to the call will be consumed."""
+    # Metrics are only reported by the main host of the metric reporting role.
+    if not self._is_metric_reporting_role or not self._is_main_host:
+      return False
+    if running_mode.value & _EVAL_OR_DECODE_MODE:
+      return True
+    return is_last_ckpt and not (self._needs_eval or self._needs_decode)
+
   def _compute_reward(
       self, metrics: Dict[str, float], tuning_step: int) -> float:
     if self._reward_fn is None:
@@ -453,12 +528,15 @@ class EarlyStoppingFn:
       tuning_step: int,
       is_last_ckpt: bool):
     """Handle metric update."""
-    assert jax.process_index() == 0
+    assert self._is_main_host
 
     # Append sub_experiment_id as the suffix.
-    if self._sub_experiment_id:
-      metrics = {f'{k}:{self._sub_experiment_id}': v
-                 for k, v in metrics.items()}
+    if self._metric_key_suffix:
+      suffixed_keys = self._suffixed_metric_keys
+      for k in metrics:
+        if k not in suffixed_keys:
+          suffixed_keys[k] = k + self._metric_key_suffix
+      metrics = {suffixed_keys[k]: v for k, v in metrics.items()}
 
     try:
       # Computing reward and used metrics for reporting back to the
@@ -527,13 +605,8 @@ class EarlyStoppingFn:
     # Poll the metrics across steps for aggregation.
     if aggregate_metrics:
       assert global_step is not None
-      metrics_across_steps = []
-      for m in self._feedback.get_trial().measurements:
-        metrics = dict(m.metrics)
-        metrics['reward'] = m.reward
-        metrics_across_steps.append((m.step, metrics))
-
-      final_metrics = self._cross_step_metric_aggregator(metrics_across_steps)
+      final_metrics = self._cross_step_metric_aggregator.aggregate_measurements(
+          self._feedback.get_trial().measurements)
       final_metrics.pop('reward', None)
       final_reward, used_metrics = self._reward_and_used_metrics(
           final_metrics, global_step)
@@ -548,6 +621,20 @@ class EarlyStoppingFn:
 
 def _write_file_once(file_path: epath.Path, content: Text):
   """Writes debug information to file only once."""
+  if '://' not in os.fspath(file_path):
+    # Local files can be created exclusively in one atomic call, which also
+    # avoids racing with other processes writing the same file.
+    try:
+      with open(file_path, 'x') as f:
+        f.write(content)
+    except FileExistsError:
+      pass
+    except OSError as e:
+      logging.warn(
+          'Cannot write file %r: %s. This is not an issue as the file is only '
+          'created for debugging purpose.', file_path, e)
+    return
+
   if not file_path.exists():
     try:
       file_path.write_text(content)
@@ -595,12 +682,22 @@ def should_early_stop(early_stop_fn: trainer_lib.EarlyStoppingFn,
       has_eval_metrics=bool(eval_metrics),
       has_decode_metrics=bool(decode_metrics))
 
+  # Early stopping functions (e.g. `EarlyStoppingFn`) may tell whether they
+  # will consume the metrics. When they will not, e.g. on pure training steps
+  # or on processes that do not report metrics, we skip unreplicating and
+  # aggregating the metrics, but still call the function for it to poll the
+  # trial status.
+  needs_metrics = getattr(early_stop_fn, 'needs_metrics', None)
+  if needs_metrics is not None and not needs_metrics(running_mode,
+                                                     is_last_ckpt):
+    return early_stop_fn({}, running_mode, global_step, is_last_ckpt)
+
   # Since train metrics will be produced at each step, for performance reasons,
   # we only aggregate the metrics at the last checkpoint or at the step when
   # evaluation or decoding takes place.
   train_metrics = None
   if train_weighted_scalars is not None:
-    if is_last_ckpt or running_mode.has_eval or running_mode.has_decode:
+    if is_last_ckpt or running_mode.value & _EVAL_OR_DECODE_MODE:
       train_weighted_scalars = py_utils.maybe_unreplicate_for_fully_replicated(
           train_weighted_scalars)
       train_metrics = metric_utils.as_float_dict(train_weighted_scalars)
@@ -624,48 +721,51 @@ def _aggregate_metrics(
     num_params: Optional[float] = None,
     train_steps_per_sec: Optional[float] = None) -> Dict[str, float]:
   """Aggregate metrics from training, evaluation and decoding for tuning."""
-  metrics = {}
+  # Metric dicts to be merged with their prefixes, which are collected first
+  # and then inserted in a single pass.
+  sources: List[Tuple[Dict[str, float], str]] = []
   if train_metrics is not None:
-    metric_utils.update_float_dict(metrics, train_metrics, 'train')
+    sources.append((train_metrics, 'train'))
 
   if eval_train_metrics is not None:
-    metric_utils.update_float_dict(
-        metrics, eval_train_metrics, 'eval_train/metrics')
+    sources.append((eval_train_metrics, 'eval_train/metrics'))
 
   def _add_input_based_metrics(
       input_p: Optional[List[base_input.BaseInput.HParams]],
-      metrics_list: Optional[List[Optional[Dict[str, float]]]],
-      dataset_type: Optional[str] = None,
-      category: Optional[str] = None):
-    if input_p is None or metrics_list is None:
+      dataset_type: str,
+      metrics_lists: Sequence[
+          Tuple[Optional[List[Optional[Dict[str, float]]]], Optional[str]]]):
+    # `metrics_lists` is a sequence of (per-input metrics list, category).
+    metrics_lists = [(ml, c) for ml, c in metrics_lists if ml is not None]
+    if input_p is None or not metrics_lists:
       return
-    assert len(input_p) == len(metrics_list), (input_p, metrics_list)
-    merged = {}
-    for p, m in zip(input_p, metrics_list):
-      if m is not None:
-        prefix = p.name
-        if dataset_type is not None:
-          prefix = f'{dataset_type}_{prefix}'
-        if category is not None:
-          prefix = f'{prefix}/{category}'
-        metric_utils.update_float_dict(merged, m, prefix)
-    metric_utils.update_float_dict(metrics, merged)
+    for metrics_list, _ in metrics_lists:
+      assert len(input_p) == len(metrics_list), (input_p, metrics_list)
+    category_suffixes = [
+        f'/{category}' if category is not None else ''
+        for _, category in metrics_lists]
+    # Walk the inputs once for all metric lists.
+    for p, *input_metrics in zip(input_p, *(ml for ml, _ in metrics_lists)):
+      prefix = f'{dataset_type}_{p.name}'
+      sources.extend(
+          (m, f'{prefix}{suffix}')
+          for m, suffix in zip(input_metrics, category_suffixes)
+          if m is not None)
 
   if eval_metrics:
-    eval_input_p = eval_metrics.input_p
-    _add_input_based_metrics(eval_input_p, eval_metrics.metrics_list,
-                             'eval_test', 'metrics')
-    _add_input_based_metrics(eval_input_p, eval_metrics.scoring_metrics_list,
-                             'eval_test', 'scoring_eval')
+    _add_input_based_metrics(
+        eval_metrics.input_p, 'eval_test',
+        [(eval_metrics.metrics_list, 'metrics'),
+         (eval_metrics.scoring_metrics_list, 'scoring_eval')])
   if decode_metrics:
-    decode_input_p = decode_metrics.input_p
-    _add_input_based_metrics(decode_input_p, decode_metrics.metrics_list,
-                             'decode_test')
-    _add_input_based_metrics(decode_input_p,
-                             decode_metrics.processed_metrics_list,
-                             'decode_test')
-    _add_input_based_metrics(decode_input_p, decode_metrics.seqio_metrics_list,
-                             'decode_test')
+    _add_input_based_metrics(
+        decode_metrics.input_p, 'decode_test',
+        [(decode_metrics.metrics_list, None),
+         (decode_metrics.processed_metrics_list, None),
+         (decode_metrics.seqio_metrics_list, None)])
+
+  metrics = {f'{prefix}/{k}': v
+             for source, prefix in sources for k, v in source.items()}
 
   # Add training metrics.
   def _add_metric_if_not_none(name: str, value: Optional[float]):
@@ -689,7 +789,8 @@ def is_last_checkpoint(
     decode_interval_steps: int,
     save_interval_steps: int) -> bool:
   """Returns True if current step should be treated as last evaluation."""
-  if running_mode.has_train:
+  mode = running_mode.value
+  if mode & _TRAIN_MODE:
     # When training and evaluation/decoding are done within the same process,
     # evaluation/decoding are based on current weights stored in memory.
     # Therefore, evaluation/decoding can always been performed regardless
@@ -700,10 +801,10 @@ def is_last_checkpoint(
   is_last = remaining == 0
   if not is_last:
     last_eval = False
-    if running_mode.has_eval:
+    if mode & _EVAL_MODE:
       last_eval = remaining < max(eval_interval_steps, save_interval_steps)
     last_decode = False
-    if running_mode.has_decode:
+    if mode & _DECODE_MODE:
       last_decode = remaining < max(decode_interval_steps, save_interval_steps)
     is_last = last_eval or last_decode
   return is_last
@@ -729,8 +830,6 @@ class TrialDirectoryNameGenerator:
   values in the path. For example: 'my_experiment/123/0|0.1|abc|ReLU'.
   """
 
-  _NON_PATH_FRIENDLY_CHAR_SET = re.compile(r'[^\w\d=_-{}\(\).,\[\]]+')
-
   def __init__(self,
                root_dir: epath.Path,
                search_space: pg.hyper.DynamicEvaluationContext,
@@ -749,6 +848,18 @@ class TrialDirectoryNameGenerator:
     self._use_combined_decision_point = bool(combined_decision_point_names)
     self._include_decision_names = sum(
         len(n) for n in decision_point_names) < total_name_length_threshold
+    if self._include_decision_names:
+      self._format_item = lambda k, v: f'{k}={v}'
+    else:
+      self._format_item = lambda k, v: v
+    # The hyper primitives are fixed once the search space is traced, so we
+    # resolve whether each one is a custom hyper upfront instead of checking
+    # it for every trial.
+    self._hyper_plan = [
+        (k, hyper, isinstance(hyper, pg.hyper.CustomHyper))
+        for k, hyper in search_space.hyper_dict.items()]
+    self._formatted_values: Dict[Tuple[Type[Any], Any], str] = {}
+    self._dirname_suffixes: Dict[Tuple[Any, ...], str] = {}
 
   def parameter_values(self) -> List[Tuple[str, Any]]:
     """Return the current parameter values and its choice indices.
@@ -758,25 +869,39 @@ class TrialDirectoryNameGenerator:
     Returns:
       A list of tuple (decision name, decision value, choice index).
     """
-    params = []
-    for k, hyper in self._search_space.hyper_dict.items():
-      v = self._search_space.evaluate(hyper)
-      if isinstance(hyper, pg.hyper.CustomHyper):
-        v = '(CUSTOM)'
-      params.append((k, v))
-
+    evaluate = self._search_space.evaluate
     if self._use_combined_decision_point:
-      assert len(params) == 1, params
-      assert params[0][0] == automl.COMBINED_DECISION_ATTR, params
-      combined_values = params[0][1]
+      # The search space has a single combined decision point, which is
+      # verified in `__init__`.
+      combined_values = evaluate(self._hyper_plan[0][1])
       assert isinstance(combined_values, tuple), combined_values
       assert len(combined_values) == len(self._decision_point_names), (
           self._decision_point_names, combined_values)
-      params = list(zip(self._decision_point_names, combined_values))
-    return params
+      return list(zip(self._decision_point_names, combined_values))
+    return [(k, '(CUSTOM)' if is_custom else evaluate(hyper))
+            for k, hyper, is_custom in self._hyper_plan]
 
   def format_value(self, value: Any) -> str:
     """Formats a parameter value into path-friendly string."""
+    # Integers and booleans are cheaper to format than to look up. Floats are
+    # keyed by their exact hex representation, since equal floats such as
+    # `0.0` and `-0.0` are formatted differently.
+    if isinstance(value, float):
+      key = (float, value.hex())
+    elif isinstance(value, str) or inspect.isclass(value):
+      key = (type(value), value)
+    else:
+      return self._format_value(value)
+    formatted = self._formatted_values.get(key)
+    if formatted is None:
+      formatted = self._format_value(value)
+      # Values may seldom repeat (e.g. for `pg.intv` over a large range), so
+      # we bound the cache instead of keeping every value ever formatted.
+      if len(self._formatted_values) < _MAX_FORMATTED_VALUES:
+        self._formatted_values[key] = formatted
+    return formatted
+
+  def _format_value(self, value: Any) -> str:
     if isinstance(value, float):
       return f'{value:.3e}'
     if isinstance(value, (bool, int)):
@@ -786,18 +911,33 @@ class TrialDirectoryNameGenerator:
     return self._make_path_friendly(str(value))
 
   def _make_path_friendly(self, s: str) -> str:
-    replacements = [(':', '='), ('[', '{'), (']', '}')]
-    for src, replacement in replacements:
-      s = s.replace(src, replacement)
+    return _NON_PATH_FRIENDLY_CHAR_SET.sub(
+        '', s.translate(_PATH_FRIENDLY_TRANSLATION))
 
-    return self._NON_PATH_FRIENDLY_CHAR_SET.sub('', s)
+  def dirname(self,
+              trial_id: int,
+              dna: Optional[pg.DNA] = None) -> epath.Path:
+    """Gets the directory name for a trial.
 
-  def dirname(self, trial_id: int) -> epath.Path:
-    """Gets the directory name for a trial."""
-    params = self.parameter_values()
-    kv_pairs = [(k, self.format_value(v)) for k, v in params]
-    if self._include_decision_names:
-      items = [f'{k}={v}' for k, v in kv_pairs]
-    else:
-      items = [v for _, v in kv_pairs]
-    return self._root_dir / str(trial_id) / '|'.join(items)
+    Args:
+      trial_id: ID of the trial.
+      dna: An optional DNA of the trial. If provided, it is used as the key
+        for caching the decision part of the directory name, which can be
+        reused by later trials with the same DNA (e.g. re-sampled by
+        evolutionary algorithms).
+
+    Returns:
+      The directory for the trial.
+    """
+    key = tuple(dna.to_numbers()) if dna is not None else None
+    suffix = self._dirname_suffixes.get(key) if key is not None else None
+    if suffix is None:
+      params = self.parameter_values()
+      format_item, format_value = self._format_item, self.format_value
+      suffix = '|'.join(format_item(k, format_value(v)) for k, v in params)
+      # Most DNA are never seen again (e.g. for large search spaces), so we
+      # bound the cache like the one of formatted values.
+      if (key is not None and
+          len(self._dirname_suffixes) < _MAX_DIRNAME_SUFFIXES):
+        self._dirname_suffixes[key] = suffix
+    return self._root_dir / f'{trial_id}/{suffix}'
@@ -17,6 +17,7 @@
 
 import math
 from typing import Callable, Dict, List, Optional, Type
+from unittest import mock
 from absl.testing import absltest
 from clu import platform
 from etils import epath
@@ -365,6 +366,13 @@ class GetSearchSpaceTest(absltest.TestCase):
     }))
     self.assertEqual(search_space.dna_spec.space_size, 3 * 3 * 2 * 3 * 3)
 
+  def test_search_space_is_cached_per_experiment(self):
+    experiment_config = TuningExperiment()
+    search_space = tuning_lib.get_search_space(experiment_config)
+    self.assertIs(tuning_lib.get_search_space(experiment_config), search_space)
+    self.assertIsNot(
+        tuning_lib.get_search_space(TuningExperiment()), search_space)
+
   def test_parameter_sweep_space_with_cartesian_product(self):
     search_space = tuning_lib.get_search_space(
         ParameterSweepingWithCartesianProduct())
@@ -770,6 +778,75 @@ class TrialDirnameTest(absltest.TestCase):
         str(get_trial_dirname(_fn, 1, pg.DNA([0, 'xyz']))),
         'root/1/x=1|y=(CUSTOM)')
 
+  def test_format_value_with_equal_values(self):
+    search_space = pg.hyper.trace(
+        lambda: pg.oneof([1, 2], name='x'), require_hyper_name=True)
+    dirname_generator = tuning_lib.TrialDirectoryNameGenerator(
+        epath.Path('root'), search_space)
+    # Equal values that are formatted differently shall not share cache.
+    for first, second, expected in [
+        (0.0, -0.0, '-0.000e+00'),
+        (-0.0, 0.0, '0.000e+00'),
+        ((1, 2), (1.0, 2.0), '(1.0,2.0)'),
+        (1, True, 'True'),
+        (1.0, 1, '1')]:
+      _ = dirname_generator.format_value(first)
+      self.assertEqual(dirname_generator.format_value(second), expected)
+
+    # Floats shall be formatted once and then read from the cache.
+    with mock.patch.object(
+        dirname_generator, '_format_value',
+        wraps=dirname_generator._format_value) as format_value:
+      self.assertEqual(dirname_generator.format_value(0.5), '5.000e-01')
+      self.assertEqual(dirname_generator.format_value(0.5), '5.000e-01')
+      format_value.assert_called_once_with(0.5)
+
+  def test_trial_dirname_cached_by_dna(self):
+    search_space = pg.hyper.trace(
+        lambda: pg.oneof([1, 2], name='x'), require_hyper_name=True)
+    dirname_generator = tuning_lib.TrialDirectoryNameGenerator(
+        epath.Path('root'), search_space)
+    dna = pg.DNA(1)
+    dna.use_spec(search_space.dna_spec)
+    with search_space.apply(dna):
+      self.assertEqual(str(dirname_generator.dirname(1, dna)), 'root/1/x=2')
+
+    # Trials with the same DNA reuse the cached name outside the context.
+    self.assertEqual(str(dirname_generator.dirname(2, dna)), 'root/2/x=2')
+
+
+class EarlyStoppingFnTest(absltest.TestCase):
+  """Tests for `tuning_lib.EarlyStoppingFn`."""
+
+  def _early_stopping_fn(self, reward_fn=None, is_metric_reporting_role=True):
+    return tuning_lib.EarlyStoppingFn(
+        feedback=None,
+        sub_experiment_id='',
+        reward_fn=reward_fn,
+        cross_step_metric_aggregator=None,
+        is_metric_reporting_role=is_metric_reporting_role,
+        is_last_experiment=True,
+        tuning_step_start=0)
+
+  def test_needs_metrics(self):
+    mode = trainer_lib.RunningMode
+    fn = self._early_stopping_fn()
+    self.assertTrue(fn.needs_metrics(mode.EVAL, is_last_ckpt=False))
+    self.assertTrue(fn.needs_metrics(mode.DECODE, is_last_ckpt=False))
+    self.assertFalse(fn.needs_metrics(mode.TRAIN, is_last_ckpt=False))
+    self.assertTrue(fn.needs_metrics(mode.TRAIN, is_last_ckpt=True))
+
+    # Training metrics at the last step are not needed when the reward is
+    # computed from eval metrics.
+    fn = self._early_stopping_fn(
+        reward_fn=base_hyperparams.instantiate(automl.SingleObjective.HParams(
+            metric=automl.Metric.eval('reward'))))
+    self.assertFalse(fn.needs_metrics(mode.TRAIN, is_last_ckpt=True))
+    self.assertTrue(fn.needs_metrics(mode.EVAL, is_last_ckpt=True))
+
+    fn = self._early_stopping_fn(is_metric_reporting_role=False)
+    self.assertFalse(fn.needs_metrics(mode.EVAL, is_last_ckpt=True))
+
 
 if __name__ == '__main__':
   absltest.main()